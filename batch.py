@@ -0,0 +1,256 @@
+"""
+AURA batch mode: stream a JSONL file of queries through the same brain as the app
+(Groq + web-search tool + memory vault + resilience layer), concurrently.
+
+    python batch.py queries.jsonl -o results.jsonl --concurrency 8 --rpm 300
+    python batch.py queries.jsonl -o results.jsonl --resume     # skip rows already answered
+
+Input: one JSON object per line. The query is read from --query-field, else the
+first of "query", "prompt", "input", "text", "body"; a bare JSON string also works.
+The row id is "id", else "request_id", else the line number. Rows sharing a
+"session" value are answered in file order with that session's recent history,
+like one conversation in the app; other rows run independently.
+
+Output: one JSON object per input row, appended as soon as it finishes (so the file
+is also the checkpoint): id, session, query, answer, latency_ms, usage, error.
+Rows with an error (including a degraded fallback answer) are retried on --resume,
+except unreadable input rows (bad JSON, no query), which are flagged "input_error"
+and written once.
+With the default in-process state, --resume replays the answered rows of each
+session into its history first, so later rows still see the earlier conversation.
+
+Input is read lazily and at most 2x --concurrency rows are in flight, so memory
+stays flat however large the file is.
+
+With --state-url redis://... (or AURA_STATE_URL) session history, the interaction
+log and the --rpm budget are shared with the app and with other batch workers.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import brain
+from resilience import RateLimiter
+from shared_state import SharedRateLimiter, connect_state
+
+QUERY_FIELDS = ("query", "prompt", "input", "text", "body")
+
+
+def positive(kind):
+    """argparse type: `kind` (int/float) that must be > 0."""
+    def parse(text):
+        try:
+            value = kind(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected a number, got {text!r}")
+        if not value > 0:
+            raise argparse.ArgumentTypeError(f"must be greater than 0, got {text}")
+        return value
+    return parse
+
+
+def read_rows(path, query_field=None):
+    """Yield (row_id, query, session, error) for each non-empty line."""
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield lineno, None, None, f"invalid JSON: {e}"
+                continue
+            if isinstance(row, str):
+                row = {"query": row}
+            elif not isinstance(row, dict):
+                yield lineno, None, None, "expected a JSON object or string"
+                continue
+            row_id = row.get("id", row.get("request_id", lineno))
+            if query_field:
+                query = row.get(query_field)
+            else:
+                query = next((row[k] for k in QUERY_FIELDS if row.get(k)), None)
+            if not query:
+                yield row_id, None, None, "no query field"
+                continue
+            yield row_id, str(query), row.get("session"), None
+
+
+def load_checkpoint(path, keep_answers=False):
+    """(ids, answers) from an existing output file. `ids` holds every row already answered
+    without error (or written as a permanent input error). `answers` maps id -> answer
+    text for session rows only, and only with `keep_answers`, so memory stays flat."""
+    done, answers = set(), {}
+    if not os.path.exists(path):
+        return done, answers
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from an interrupted run
+            if not row.get("error") or row.get("input_error"):
+                row_id = str(row.get("id"))
+                done.add(row_id)
+                if keep_answers and row.get("session") is not None and row.get("answer") is not None:
+                    answers[row_id] = row["answer"]
+    return done, answers
+
+
+class BatchRunner:
+    def __init__(self, client, res, state, out, deadline_s, save_to_vault):
+        self.client = client
+        self.res = res
+        self.state = state
+        self.out = out
+        self.deadline_s = deadline_s
+        self.save_to_vault = save_to_vault
+        self.lock = threading.Lock()
+        self.chains = {} # session -> future of its latest row, to keep file order
+        self.latencies = deque(maxlen=10000)
+        self.counts = {"rows": 0, "ok": 0, "errors": 0, "skipped": 0, "tokens": 0}
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+            self.counts["rows"] += 1
+            self.counts["errors" if record.get("error") else "ok"] += 1
+            self.counts["tokens"] += record.get("usage", {}).get("total_tokens", 0)
+            if record.get("latency_ms") is not None:
+                self.latencies.append(record["latency_ms"])
+
+    def run_row(self, row_id, query, session, previous=None, answered=None):
+        if previous is not None:
+            previous.exception() # wait for the earlier row of the same session
+        if answered is not None:
+            # Answered in an earlier run: only restore the exchange into the session's history
+            self.state.append_history(f"batch:{session}", [{"role": "user", "content": query},
+                                                           {"role": "assistant", "content": answered}])
+            return
+        t0 = time.perf_counter()
+        error = None
+        try:
+            history = self.state.history(f"batch:{session}", brain.HISTORY_TURNS) if session is not None else []
+            answer, usage, degraded = brain.process_brain(query, history, self.client, self.res,
+                                                          deadline_s=self.deadline_s)
+        except Exception as e:
+            answer, usage, degraded, error = None, {}, False, f"{type(e).__name__}: {e}"
+        latency_ms = round((time.perf_counter() - t0) * 1000, 1)
+        if degraded:
+            error = "degraded: backend unavailable" # stale or notice answer; retried on --resume
+
+        if answer is not None and error is None:
+            try:
+                with self.state.pipeline() as p:
+                    if session is not None:
+                        p.append_history(f"batch:{session}", [{"role": "user", "content": query},
+                                                             {"role": "assistant", "content": answer}])
+                    if self.save_to_vault:
+                        p.log_interaction(query, answer, meta=f"batch:{row_id}")
+                    p.incr("batch_rows")
+            except Exception as e:
+                error = f"state write failed: {type(e).__name__}: {e}"
+            if self.save_to_vault:
+                brain.save_interaction(query, answer, meta=f"batch:{row_id}")
+
+        self.write({"id": row_id, "session": session, "query": query, "answer": answer,
+                    "latency_ms": latency_ms, "usage": usage, "error": error})
+
+    def submit(self, pool, row_id, query, session, answered=None):
+        with self.lock:
+            previous = self.chains.get(session) if session is not None else None
+            future = pool.submit(self.run_row, row_id, query, session, previous, answered)
+            if session is not None:
+                self.chains[session] = future
+        if session is not None:
+            future.add_done_callback(lambda f: self._release_chain(session, f))
+        return future
+
+    def _release_chain(self, session, future):
+        with self.lock:
+            if self.chains.get(session) is future:
+                del self.chains[session]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of queries through the AURA brain.")
+    parser.add_argument("input", help="JSONL file of queries")
+    parser.add_argument("-o", "--output", required=True, help="JSONL results file (appended; doubles as checkpoint)")
+    parser.add_argument("--concurrency", type=positive(int), default=4, help="rows processed in parallel")
+    parser.add_argument("--rpm", type=positive(float), default=None, help="max Groq requests per minute (hedges included)")
+    parser.add_argument("--deadline", type=positive(float), default=60, help="per-row time budget in seconds")
+    parser.add_argument("--query-field", default=None, help="JSON field holding the query")
+    parser.add_argument("--resume", action="store_true", help="skip rows already answered in --output")
+    parser.add_argument("--no-vault", action="store_true", help="don't save answers to the memory vault")
+    parser.add_argument("--state-url", default=None, help="shared state backend (default: AURA_STATE_URL or memory://)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        print("🚨 CRITICAL: GROQ_API_KEY not found in .env file.", file=sys.stderr)
+        return 2
+
+    if not args.resume and os.path.exists(args.output) and os.path.getsize(args.output):
+        print(f"🚨 {args.output} already exists; pass --resume to continue it.", file=sys.stderr)
+        return 2
+
+    brain.init_db()
+    state = connect_state(args.state_url)
+    replay = args.resume and not state.shared # a fresh in-process store has no session history yet
+    done, answers = load_checkpoint(args.output, keep_answers=replay) if args.resume else (set(), {})
+    if args.rpm and state.shared:
+        limiter = SharedRateLimiter(state, "groq", args.rpm) # quota shared with every worker
+    elif args.rpm:
+        limiter = RateLimiter(args.rpm / 60, burst=args.concurrency)
+    else:
+        limiter = None
+    res = brain.make_resilience(groq_rate_limiter=limiter, max_workers=max(32, args.concurrency * 2))
+    client = brain.make_client(api_key)
+
+    in_flight = threading.BoundedSemaphore(args.concurrency * 2)
+    t_start = time.perf_counter()
+    with open(args.output, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="aura-batch") as pool:
+        runner = BatchRunner(client, res, state, out, args.deadline, save_to_vault=not args.no_vault)
+        for row_id, query, session, error in read_rows(args.input, args.query_field):
+            answered = None
+            if str(row_id) in done:
+                runner.counts["skipped"] += 1
+                answered = answers.pop(str(row_id), None)
+                if answered is None or session is None:
+                    continue
+            elif error:
+                runner.write({"id": row_id, "session": None, "query": query, "answer": None,
+                              "latency_ms": None, "usage": {}, "error": error, "input_error": True})
+                continue
+            in_flight.acquire()
+            future = runner.submit(pool, row_id, query, session, answered)
+            future.add_done_callback(lambda f: in_flight.release())
+    wall = time.perf_counter() - t_start
+
+    c = runner.counts
+    lat = sorted(runner.latencies)
+    p50 = lat[len(lat) // 2] if lat else 0.0
+    p95 = lat[int(0.95 * (len(lat) - 1))] if lat else 0.0
+    print(f"⚡ AURA batch: {c['rows']} rows ({c['ok']} ok, {c['errors']} errors, {c['skipped']} skipped) "
+          f"in {wall:.1f}s = {c['rows'] / wall if wall else 0:.2f} rows/s", file=sys.stderr)
+    print(f"  latency ms p50={p50} p95={p95} mean={round(statistics.fmean(lat), 1) if lat else 0.0}  "
+          f"tokens={c['tokens']}", file=sys.stderr)
+    groq = res["groq"].snapshot()
+    print(f"  groq: {groq['state']}, hedges won {groq['hedge_wins']}/{groq['hedges']}, "
+          f"timeouts {groq['timeouts']}, fast-fails {groq['rejected']}", file=sys.stderr)
+    return 1 if c["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""
+AURA brain: Groq inference with web-search tool use, the memory vault and the
+resilience wiring. No Streamlit imports, so streamlit_app.py and batch.py run the
+exact same pipeline.
+"""
+import datetime
+import json
+import sqlite3
+from pathlib import Path
+from groq import Groq, BadRequestError
+from duckduckgo_search import DDGS
+from resilience import Deadline, Dependency, LatencyTracker, StaleCache
+
+# --- CONFIGURATION (BEST PERFORMANCE) ---
+GROQ_MODEL = "llama-3.3-70b-versatile" # Smartest fast model
+TURN_DEADLINE_S = 12 # Whole-turn budget: every Groq/search call shares it
+SEARCH_BUDGET_S = 4 # Max slice of the turn a web search may take
+HISTORY_TURNS = 4 # Recent messages sent along as context
+FALLBACK_REPLY = "My neural core is unreachable right now. Please try again in a moment."
+
+# Paths
+BASE_DIR = Path(__file__).parent
+DATA_DIR = BASE_DIR / "aura_data"
+DATA_DIR.mkdir(exist_ok=True, parents=True)
+DB_PATH = DATA_DIR / "aura_memory.db"
+
+SYS_PROMPT = """
+    You are AURA, an advanced AI.
+    Traits: Intelligent, Fast, Helpful.
+
+    TOOL USE RULES:
+    - If the user asks for current info/news, YOU MUST USE THE search_web TOOL.
+    - AFTER calling the tool, you will receive the search results.
+    - You MUST then read those results and Synthesize a clear, direct answer to the user's question.
+    - Do NOT just say "search results found". Answer the question using the data!
+    - Keep voice answers concise (under 2 sentences) but informative.
+    """
+
+# --- DATABASE & MEMORY (Robust) ---
+def init_db():
+    """Initialize SQLite database with error handling for read-only environments."""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS memory_vault
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      timestamp TEXT,
+                      user_query TEXT,
+                      bot_response TEXT,
+                      meta_info TEXT)''')
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        return False
+
+def save_interaction(query, response, meta=""):
+    try:
+        if not DB_PATH.parent.exists(): return
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        c.execute("INSERT INTO memory_vault (timestamp, user_query, bot_response, meta_info) VALUES (?, ?, ?, ?)",
+                  (ts, query, response, meta))
+        conn.commit()
+        conn.close()
+    except: pass
+
+# --- BACKENDS ---
+def make_client(api_key):
+    # Retries are handled by hedging + breakers, not blind SDK retries
+    return Groq(api_key=api_key, max_retries=0)
+
+def make_resilience(groq_rate_limiter=None, max_workers=32):
+    """Breakers, latency trackers and stale caches; build once per process and share."""
+    return {
+        # A 400 (bad tool call etc.) means Groq is up, so it doesn't trip the breaker
+        "groq": Dependency("groq", latency=LatencyTracker(default_p95=3.0), max_workers=max_workers,
+                           should_trip=lambda e: not isinstance(e, BadRequestError),
+                           rate_limiter=groq_rate_limiter),
+        "search": Dependency("search", latency=LatencyTracker(default_p95=1.5), max_workers=max_workers),
+        "answers": StaleCache(), # last good answer per query + recent context
+        "searches": StaleCache(), # last good search summary per query
+    }
+
+# --- TOOLS (WEB SEARCH) ---
+def search_web(query, res, deadline=None):
+    """Deep web search using DuckDuckGo, behind the search breaker; falls back to the last good result."""
+    deadline = deadline or Deadline(SEARCH_BUDGET_S)
+
+    def fetch():
+        with DDGS(timeout=max(1, int(deadline.remaining()))) as ddgs:
+            return list(ddgs.text(query, max_results=3))
+
+    try:
+        results = res["search"].call(fetch, deadline)
+    except Exception as e:
+        stale = res["searches"].get(query)
+        if stale:
+            return stale + "\n(Cached result: live search is unavailable right now.)"
+        return f"Search unavailable ({type(e).__name__}). Answer from your own knowledge and say it may be outdated."
+    if results:
+        summary = "\n".join([f"- {r['title']}: {r['body']} ({r['href']})" for r in results])
+        res["searches"].put(query, summary)
+        return summary
+    return "No relevant search results found."
+
+tools = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_web",
+            "description": "Search the internet for real-time information, news, stocks, or facts.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "The search query keywords",
+                    }
+                },
+                "required": ["query"],
+            },
+        },
+    }
+]
+
+# --- BRAIN (GROQ + TOOLS) ---
+def _notify_nothing(text):
+    pass
+
+def answer_key(user_input, history):
+    """Stale-cache key: the query plus the context it was answered in.
+
+    The cache is shared by every session in the process, so a context-dependent
+    query ("what did I just say?") must never be served from another conversation.
+    """
+    recent = [[turn["role"], turn["content"]] for turn in history[-HISTORY_TURNS:]]
+    return json.dumps([recent, user_input], ensure_ascii=False)
+
+def fallback_reply(user_input, history, error, res, notify=_notify_nothing):
+    """Degraded answer when Groq is unhealthy: last good answer for this query in this context, else a short notice."""
+    cached = res["answers"].get(answer_key(user_input, history))
+    notify(f"⚠️ Brain degraded ({type(error).__name__}) - {'cached answer' if cached else 'no answer'}")
+    return cached if cached else FALLBACK_REPLY
+
+def process_brain(user_input, history, client, res, notify=_notify_nothing, deadline_s=TURN_DEADLINE_S):
+    """One turn: context from `history`, Groq inference, optional web search, answer.
+
+    Returns (answer, usage, degraded): usage sums token counts over every completion
+    in the turn; degraded is True when Groq failed and the answer is a fallback (the
+    stale cached answer or the notice). `notify(text)` surfaces progress (the app
+    passes st.toast).
+    """
+    deadline = Deadline(deadline_s)
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    def complete(**kwargs):
+        msgs = list(messages) # snapshot: a hedged duplicate may still be sending it
+        completion = res["groq"].call(lambda: client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=msgs,
+            max_tokens=256,
+            timeout=max(0.1, deadline.remaining()),
+            **kwargs
+        ), deadline)
+        if getattr(completion, "usage", None):
+            for key in usage:
+                usage[key] += getattr(completion.usage, key, 0) or 0
+        return completion
+
+    # 1. Build Context
+    messages = [{"role": "system", "content": SYS_PROMPT}]
+
+    # Add recent history
+    for turn in history[-HISTORY_TURNS:]:
+        messages.append({"role": turn["role"], "content": turn["content"]})
+
+    messages.append({"role": "user", "content": user_input})
+
+    # 2. Inference
+    try:
+        completion = complete(tools=tools, tool_choice="auto")
+
+        msg = completion.choices[0].message
+
+        # 3. Tool Calling Handling
+        if msg.tool_calls:
+            tool_call = msg.tool_calls[0]
+            if tool_call.function.name == "search_web":
+                args = json.loads(tool_call.function.arguments)
+                notify(f"🔎 Searching Web: {args['query']}")
+                search_res = search_web(args['query'], res, deadline.sub(SEARCH_BUDGET_S))
+
+                # Feed tool output back
+                messages.append(msg)
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": str(search_res)
+                })
+
+                # Final response (Second Turn)
+                # We need to tell the model to use the tool info to answer
+                final_res = complete()
+                answer = final_res.choices[0].message.content
+                res["answers"].put(answer_key(user_input, history), answer)
+                return answer, usage, False
+
+        res["answers"].put(answer_key(user_input, history), msg.content)
+        return msg.content, usage, False
+
+    except Exception as e:
+        # Fallback
+        if "tool_use_failed" in str(e) or "400" in str(e):
+             notify("Tool Error - Retrying basic response")
+             try:
+                 messages.append({"role": "user", "content": "Please answer without tools if possible."})
+                 completion = complete()
+                 return completion.choices[0].message.content, usage, False
+             except Exception as retry_error:
+                 e = retry_error
+        return fallback_reply(user_input, history, e, res, notify), usage, True
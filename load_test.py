@@ -0,0 +1,504 @@
+"""
+AURA load & soak test.
+
+Starts streamlit_app.py on a local headless server with fake Groq and DuckDuckGo
+backends (no network, no API key needed) and drives it with N concurrent websocket
+sessions speaking Streamlit's own BackMsg/ForwardMsg protocol, like N browser tabs.
+Reports per-rerun latency, payload bytes and deltas per turn, server RSS growth per
+session, SQLite memory_vault write contention and the error rate.
+
+With --workers N it starts N app servers sharing one state backend (a local
+Redis-protocol stand-in, see shared_state.MiniRedisServer) and spreads sessions over
+them; --hop moves every session to the next worker on each turn, like a load
+balancer without sticky sessions. A turn whose bubbles show lost history counts
+as an error.
+
+    python load_test.py --sessions 8 --turns 10
+    python load_test.py --sessions 4 --duration 300          # soak
+    python load_test.py --workers 3 --sessions 12 --hop      # horizontal scaling
+    python load_test.py --max-p95-ms 1500 --max-error-rate 0  # CI gate (exit 1 on breach)
+"""
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+BASE_DIR = Path(__file__).parent
+APP_FILE = "streamlit_app.py"
+
+SAMPLE_QUERIES = [
+    "hello aura",
+    "what is the latest news about AI",
+    "tell me a joke",
+    "current price of bitcoin",
+    "summarize our conversation",
+    "what's the weather in Lahore today",
+]
+
+# Substrings of a reply bubble that mean the turn failed or degraded
+DEGRADED_MARKERS = ("neural error", "neural core is unreachable")
+
+# --- FAKE BACKENDS (installed inside the server process) ---
+class FakeGroq:
+    """Stand-in for groq.Groq. Sleeps `latency` seconds per completion and asks for
+    the search_web tool on queries that look like they need fresh info."""
+    latency = 0.05
+    failure_rate = 0.0
+
+    def __init__(self, api_key=None, **kwargs):
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    def _create(self, model=None, messages=None, tools=None, max_tokens=None, **kwargs):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("fake groq: 503 service unavailable")
+
+        last = messages[-1]
+        last_role = last["role"] if isinstance(last, dict) else last.role
+        query = last["content"] if isinstance(last, dict) else ""
+        tool_calls = None
+        if tools and last_role == "user" and any(w in query for w in ("news", "price", "weather", "latest")):
+            tool_calls = [types.SimpleNamespace(
+                id="call_0",
+                type="function",
+                function=types.SimpleNamespace(name="search_web", arguments=json.dumps({"query": query})),
+            )]
+        msg = types.SimpleNamespace(role="assistant", content=None if tool_calls else f"Fake answer to: {query[:40]}",
+                                    tool_calls=tool_calls)
+        usage = types.SimpleNamespace(prompt_tokens=len(messages) * 50, completion_tokens=20,
+                                      total_tokens=len(messages) * 50 + 20)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=msg)], usage=usage)
+
+
+class FakeDDGS:
+    """Stand-in for duckduckgo_search.DDGS (context manager with .text())."""
+    latency = 0.02
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def text(self, query, max_results=3):
+        time.sleep(self.latency)
+        return [{"title": f"Result {i}", "body": f"Snippet about {query}", "href": f"https://example.com/{i}"}
+                for i in range(max_results)]
+
+
+# --- SQLITE CONTENTION PROBE (installed inside the server process) ---
+class DbStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.write_ms = []
+        self.lock_errors = 0
+
+    def record(self, ms, locked=False):
+        with self.lock:
+            self.writes += 1
+            self.write_ms.append(ms)
+            if locked:
+                self.lock_errors += 1
+
+
+DB_STATS = DbStats()
+_real_connect = sqlite3.connect
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        if not sql.lstrip().upper().startswith("INSERT"):
+            return super().execute(sql, *args)
+        t0 = time.perf_counter()
+        try:
+            result = super().execute(sql, *args)
+        except sqlite3.OperationalError as e:
+            DB_STATS.record((time.perf_counter() - t0) * 1000, locked="locked" in str(e))
+            raise
+        DB_STATS.record((time.perf_counter() - t0) * 1000)
+        return result
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+
+def timed_connect(*args, **kwargs):
+    kwargs.setdefault("factory", TimedConnection)
+    return _real_connect(*args, **kwargs)
+
+
+def serve(args):
+    """Server-process entry point: install the fakes, then hand over to `streamlit run`."""
+    FakeGroq.latency = args.llm_latency_ms / 1000
+    FakeGroq.failure_rate = args.llm_failure_rate
+    FakeDDGS.latency = args.search_latency_ms / 1000
+    os.environ["GROQ_API_KEY"] = "load-test"
+    for p in (mock.patch("groq.Groq", FakeGroq),
+              mock.patch("duckduckgo_search.DDGS", FakeDDGS),
+              mock.patch("sqlite3.connect", timed_connect)):
+        p.start()
+
+    def dump_stats():
+        with DB_STATS.lock:
+            Path(args.stats_file).write_text(json.dumps({
+                "writes": DB_STATS.writes, "lock_errors": DB_STATS.lock_errors, "write_ms": DB_STATS.write_ms,
+            }))
+    atexit.register(dump_stats)
+
+    from streamlit.web import cli as stcli
+    sys.argv = ["streamlit", "run", str(Path(args.workdir) / APP_FILE),
+                "--server.headless", "true",
+                "--server.port", str(args.serve),
+                "--server.fileWatcherType", "none",
+                "--browser.gatherUsageStats", "false",
+                "--logger.level", "error"]
+    stcli.main()
+
+
+# --- METRICS ---
+def rss_mb(pid):
+    """Resident set size of `pid` in MB (Linux /proc; 0.0 where unavailable)."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return 0.0
+
+
+def pct(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+# --- WEBSOCKET SESSION (one simulated browser tab) ---
+class Session:
+    """Minimal Streamlit protocol client: sends rerun_script BackMsgs and reads
+    ForwardMsgs until script_finished, recording time, bytes and deltas."""
+
+    def __init__(self, url, timeout, query_string=""):
+        from websockets.sync.client import connect
+        self._stack = contextlib.ExitStack()
+        self.ws = self._stack.enter_context(
+            connect(url, subprotocols=["streamlit"], max_size=None, open_timeout=timeout))
+        self.timeout = timeout
+        self.chat_input_id = None
+        self.fragment_id = ""
+        self.query_string = query_string # carries ?sid=..., as the browser URL would
+
+    def close(self):
+        self._stack.close()
+
+    def rerun(self, chat_text=None):
+        """One rerun. Returns (ms, bytes_received, deltas, bubbles, error)."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        back = BackMsg()
+        back.rerun_script.query_string = self.query_string
+        if chat_text is not None:
+            widget = back.rerun_script.widget_states.widgets.add()
+            widget.id = self.chat_input_id
+            if "chat_input_value" in widget.DESCRIPTOR.fields_by_name:
+                widget.chat_input_value.data = chat_text
+            else:  # older Streamlit releases
+                widget.string_trigger_value.data = chat_text
+            back.rerun_script.fragment_id = self.fragment_id
+
+        t0 = time.perf_counter()
+        self.ws.send(back.SerializeToString())
+        received, deltas, bubbles, error = 0, 0, 0, None
+        while True:
+            raw = self.ws.recv(timeout=self.timeout)
+            received += len(raw)
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            kind = msg.WhichOneof("type")
+            if kind == "delta":
+                deltas += 1
+                element = msg.delta.new_element
+                etype = element.WhichOneof("type") if msg.delta.WhichOneof("type") == "new_element" else None
+                if etype == "chat_input":
+                    self.chat_input_id = element.chat_input.id
+                    self.fragment_id = msg.delta.fragment_id
+                elif etype == "exception":
+                    error = element.exception.message or element.exception.type
+                elif etype == "markdown" and "chat-row" in element.markdown.body:
+                    bubbles += 1
+                    if bubbles > 1:
+                        continue # bubbles render newest first; older ones were already counted
+                    body = element.markdown.body
+                    marker = next((m for m in DEGRADED_MARKERS if m in body), None)
+                    if marker:
+                        error = marker
+            elif kind == "page_info_changed":
+                self.query_string = msg.page_info_changed.query_string
+            elif kind == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    error = "compile error"
+                break
+        return (time.perf_counter() - t0) * 1000, received, deltas, bubbles, error
+
+
+def run_session(urls, session_id, turns, deadline, timeout, hop=False):
+    """Page load on worker `session_id % len(urls)`, then chat inputs until `turns`
+    are sent or `deadline` passes; with `hop`, reconnect to the next worker each turn."""
+    stats = {"latency_ms": [], "turn_bytes": [], "turn_deltas": [], "errors": [], "turns": 0}
+    rng = random.Random(session_id)
+    worker = session_id % len(urls)
+    session = None
+
+    def page_load(query_string=""):
+        new = Session(urls[worker], timeout, query_string)
+        ms, _, _, _, error = new.rerun()
+        stats["latency_ms"].append(ms)
+        if error:
+            stats["errors"].append(error)
+        return new
+
+    try:
+        session = page_load()
+        while (turns is None or stats["turns"] < turns) and (deadline is None or time.time() < deadline):
+            if hop and stats["turns"]:
+                session.close()
+                worker = (worker + 1) % len(urls)
+                session = page_load(session.query_string)
+            ms, received, deltas, bubbles, error = session.rerun(rng.choice(SAMPLE_QUERIES))
+            stats["turns"] += 1
+            stats["latency_ms"].append(ms)
+            stats["turn_bytes"].append(received)
+            stats["turn_deltas"].append(deltas)
+            if not error and bubbles < min(2 * stats["turns"], 6): # the app shows the last 6 messages
+                error = "history lost"
+            if error:
+                stats["errors"].append(error)
+    except Exception as e:
+        stats["errors"].append(f"{type(e).__name__}: {e}")
+    finally:
+        if session is not None:
+            session.close()
+    return stats
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_healthy(port, proc, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"streamlit server exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("streamlit server did not become healthy")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline multi-session load/soak test for streamlit_app.py")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument("--workers", type=int, default=1, help="app server processes behind the simulated balancer")
+    parser.add_argument("--state", choices=["memory", "redis"], default=None,
+                        help="state backend (default: memory for 1 worker, redis stand-in for more)")
+    parser.add_argument("--hop", action="store_true", help="move each session to the next worker every turn")
+    parser.add_argument("--turns", type=int, default=5, help="chat inputs per session (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="soak mode: keep sending for N seconds")
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="fake Groq latency per completion")
+    parser.add_argument("--search-latency-ms", type=float, default=20, help="fake DDGS latency per search")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="fraction of fake Groq calls that raise")
+    parser.add_argument("--timeout", type=float, default=60, help="per-rerun timeout (s)")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="exit 1 if rerun p95 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="exit 1 if error rate exceeds this")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    # internal: server-process mode
+    parser.add_argument("--serve", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--stats-file", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve is not None:
+        return serve(args)
+
+    # Run a private copy of the app so the load test gets its own aura_data/ vault
+    workdir = Path(tempfile.mkdtemp(prefix="aura_load_"))
+    for path in BASE_DIR.glob("*.py"):
+        shutil.copy(path, workdir / path.name)
+    shutil.copytree(BASE_DIR / "assets", workdir / "assets", dirs_exist_ok=True)
+
+    state = args.state or ("redis" if args.workers > 1 else "memory")
+    env = dict(os.environ)
+    stand_in = None
+    if state == "redis":
+        from shared_state import MiniRedisServer
+        stand_in = MiniRedisServer().start()
+        env["AURA_STATE_URL"] = stand_in.url
+
+    servers, urls, stats_files = [], [], []
+    for i in range(args.workers):
+        port = free_port()
+        stats_files.append(workdir / f"db_stats_{i}.json")
+        servers.append(subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), "--serve", str(port),
+             "--workdir", str(workdir), "--stats-file", str(stats_files[-1]),
+             "--llm-latency-ms", str(args.llm_latency_ms),
+             "--search-latency-ms", str(args.search_latency_ms),
+             "--llm-failure-rate", str(args.llm_failure_rate)],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+        urls.append((port, f"ws://127.0.0.1:{port}/_stcore/stream"))
+
+    def total_rss():
+        return sum(rss_mb(server.pid) for server in servers)
+
+    try:
+        for (port, _), server in zip(urls, servers):
+            wait_healthy(port, server, args.timeout)
+        urls = [url for _, url in urls]
+        # Warm-up session per worker so imports and the DB schema don't count against session RSS
+        for i in range(args.workers):
+            run_session(urls, i, 1, None, args.timeout)
+        rss_start = total_rss()
+
+        rss_peak = [rss_start]
+        done = threading.Event()
+
+        def sample_rss():
+            while not done.wait(0.25):
+                rss_peak[0] = max(rss_peak[0], total_rss())
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+
+        deadline = time.time() + args.duration if args.duration else None
+        turns = None if args.duration else args.turns
+        t_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            results = list(pool.map(lambda i: run_session(urls, i, turns, deadline, args.timeout, args.hop),
+                                    range(args.sessions)))
+        wall = time.perf_counter() - t_start
+        done.set()
+        sampler.join()
+        rss_end = total_rss()
+    finally:
+        for server in servers:
+            server.send_signal(signal.SIGTERM)
+        for server in servers:
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if stand_in:
+            stand_in.stop()
+        db = {"writes": 0, "lock_errors": 0, "write_ms": []}
+        for stats_file in stats_files:
+            if stats_file.exists():
+                worker_db = json.loads(stats_file.read_text())
+                for key in db:
+                    db[key] += worker_db.get(key, 0 if key != "write_ms" else [])
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = [ms for r in results for ms in r["latency_ms"]]
+    turn_bytes = [b for r in results for b in r["turn_bytes"]]
+    turn_deltas = [d for r in results for d in r["turn_deltas"]]
+    errors = [e for r in results for e in r["errors"]]
+    sent = sum(r["turns"] for r in results)
+    reruns = len(latencies)
+    write_ms = db.get("write_ms", [])
+    report = {
+        "workers": args.workers,
+        "state": state,
+        "sessions": args.sessions,
+        "turns": sent,
+        "reruns": reruns,
+        "wall_s": round(wall, 2),
+        "turns_per_s": round(sent / wall, 2) if wall else 0.0,
+        "rerun_ms": {
+            "p50": round(pct(latencies, 50), 1),
+            "p95": round(pct(latencies, 95), 1),
+            "p99": round(pct(latencies, 99), 1),
+            "max": round(max(latencies), 1) if latencies else 0.0,
+            "mean": round(statistics.fmean(latencies), 1) if latencies else 0.0,
+        },
+        "per_turn": {
+            "bytes_mean": round(statistics.fmean(turn_bytes)) if turn_bytes else 0,
+            "bytes_p95": pct(turn_bytes, 95),
+            "deltas_mean": round(statistics.fmean(turn_deltas), 1) if turn_deltas else 0.0,
+        },
+        "server_rss_mb": {
+            "start": round(rss_start, 1),
+            "peak": round(rss_peak[0], 1),
+            "end": round(rss_end, 1),
+            "per_session": round((rss_peak[0] - rss_start) / args.sessions, 2),
+        },
+        "sqlite": {
+            "writes": db.get("writes", 0),
+            "lock_errors": db.get("lock_errors", 0),
+            "write_ms_p95": round(pct(write_ms, 95), 2),
+            "write_ms_max": round(max(write_ms), 2) if write_ms else 0.0,
+        },
+        "errors": len(errors),
+        "error_rate": round(len(errors) / reruns, 4) if reruns else 1.0,
+        "error_samples": sorted(set(errors))[:5],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"⚡ AURA load test: {report['workers']} worker(s) on {report['state']} state, "
+              f"{report['sessions']} sessions, {report['turns']} turns in {report['wall_s']}s "
+              f"({report['turns_per_s']} turns/s)")
+        r = report["rerun_ms"]
+        print(f"  rerun latency ms  p50={r['p50']}  p95={r['p95']}  p99={r['p99']}  max={r['max']}")
+        t = report["per_turn"]
+        print(f"  per turn          bytes={t['bytes_mean']} (p95 {t['bytes_p95']})  deltas={t['deltas_mean']}")
+        m = report["server_rss_mb"]
+        print(f"  server RSS MB     start={m['start']}  peak={m['peak']}  end={m['end']}  "
+              f"per_session=+{m['per_session']}")
+        d = report["sqlite"]
+        print(f"  sqlite writes     n={d['writes']}  lock_errors={d['lock_errors']}  "
+              f"p95={d['write_ms_p95']}ms  max={d['write_ms_max']}ms")
+        print(f"  errors            {report['errors']} ({report['error_rate']:.2%})")
+        for sample in report["error_samples"]:
+            print(f"    - {sample}")
+
+    failed = False
+    if args.max_p95_ms is not None and report["rerun_ms"]["p95"] > args.max_p95_ms:
+        print(f"❌ p95 {report['rerun_ms']['p95']}ms > {args.max_p95_ms}ms", file=sys.stderr)
+        failed = True
+    if args.max_error_rate is not None and report["error_rate"] > args.max_error_rate:
+        print(f"❌ error rate {report['error_rate']} > {args.max_error_rate}", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
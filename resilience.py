@@ -0,0 +1,294 @@
+"""
+Resilience layer for AURA's network dependencies (Groq, DuckDuckGo).
+
+- Deadline:       one time budget per turn, shared by every call in it.
+- CircuitBreaker: fails fast after repeated failures, probes again after a cool-down.
+- Dependency:     runs a call under the deadline and breaker, and fires one hedged
+                  duplicate when the first attempt outlives the observed p95.
+- StaleCache:     last good result per key, served when a dependency is unhealthy.
+- RateLimiter:    token bucket that keeps concurrent callers under a backend's quota.
+
+No Streamlit imports here, so the same objects work in the app and in scripts.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class DeadlineExceeded(TimeoutError):
+    """The turn's time budget ran out before the dependency answered."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The dependency's breaker is open; the call was not attempted."""
+
+
+# --- DEADLINE ---
+class Deadline:
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def sub(self, seconds):
+        """A child deadline capped at `seconds`, never later than this one."""
+        child = Deadline(0)
+        child.expires_at = min(self.expires_at, time.monotonic() + seconds)
+        return child
+
+
+# --- LATENCY TRACKING ---
+class LatencyTracker:
+    """Rolling window of successful call latencies (seconds)."""
+
+    def __init__(self, window=200, min_samples=20, default_p95=2.0):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.default_p95 = default_p95
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def p95(self):
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return self.default_p95
+            ordered = sorted(self.samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+# --- CIRCUIT BREAKER ---
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures; open -> half_open
+    after `reset_timeout` seconds; one successful probe closes it again."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.probe_thread = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True  # let exactly one probe through
+                self.probe_thread = threading.get_ident()
+                return True
+            return False
+
+    def release(self):
+        """Give back the probe slot if this thread's allowed call never reached the backend."""
+        with self.lock:
+            if self.probing and self.probe_thread == threading.get_ident():
+                self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+# --- STALE CACHE ---
+class StaleCache:
+    """Small LRU of last good results, used as the fail-fast fallback."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(text):
+        return " ".join(str(text).lower().split())
+
+    def get(self, text):
+        with self.lock:
+            k = self.key(text)
+            if k in self.data:
+                self.data.move_to_end(k)
+                return self.data[k]
+            return None
+
+    def put(self, text, value):
+        with self.lock:
+            self.data[self.key(text)] = value
+            self.data.move_to_end(self.key(text))
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+
+# --- RATE LIMITER ---
+class RateLimiter:
+    """Token bucket: `rate` calls per second, bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self, deadline):
+        """Block until a token is free, or raise DeadlineExceeded if that would overrun `deadline`."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            if delay > deadline.remaining():
+                raise DeadlineExceeded("rate limit wait would overrun the deadline")
+            time.sleep(delay)
+
+
+# --- DEPENDENCY (deadline + hedge + breaker) ---
+class Dependency:
+    """Wraps calls to one backend.
+
+    `call(fn, deadline)` runs `fn()` on a worker thread and waits for at most the
+    deadline. If it is still running after the observed p95, one duplicate is sent
+    and whichever finishes first wins. Hedges are capped at `max_hedge_ratio` of
+    calls so a globally slow backend is not hit with double load, and are skipped
+    unless the breaker is closed. Exceptions for which `should_trip(exc)` is False
+    (e.g. a 400) don't count against the breaker.
+    With a `rate_limiter`, every attempt (hedges included) spends a token.
+    """
+
+    def __init__(self, name, breaker=None, latency=None, max_workers=32,
+                 max_hedge_ratio=0.1, should_trip=None, rate_limiter=None):
+        self.name = name
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = latency or LatencyTracker()
+        self.max_hedge_ratio = max_hedge_ratio
+        self.should_trip = should_trip or (lambda exc: True)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"aura-{name}")
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "failures": 0, "timeouts": 0, "rejected": 0, "hedges": 0, "hedge_wins": 0}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _timed(self, fn):
+        t0 = time.monotonic()
+        result = fn()
+        self.latency.record(time.monotonic() - t0)
+        return result
+
+    def call(self, fn, deadline):
+        if deadline.expired:
+            self._count("timeouts")
+            raise DeadlineExceeded(f"{self.name}: no time left in this turn")
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            # Only a call that will actually go out spends quota (and waits for it)
+            if self.rate_limiter:
+                try:
+                    self.rate_limiter.acquire(deadline)
+                except DeadlineExceeded:
+                    self._count("timeouts")
+                    raise
+            self._count("calls")
+            primary = self.pool.submit(self._timed, fn)
+        except BaseException:
+            self.breaker.release()  # nothing was sent, so a half-open probe isn't used up
+            raise
+        pending = {primary}
+        hedge_delay = min(self.latency.p95(), deadline.remaining())
+        done, _ = wait(pending, timeout=hedge_delay)
+
+        if not done and not deadline.expired and self._may_hedge():
+            self._count("hedges")
+            pending.add(self.pool.submit(self._timed, fn))
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                break  # deadline hit; the stragglers finish (or time out) on their own
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    self.breaker.record_success()
+                    return future.result()
+                error = future.exception()
+
+        if error is None:
+            self._count("timeouts")
+            self.breaker.record_failure()
+            raise DeadlineExceeded(f"{self.name} did not answer within the turn deadline")
+        self._count("failures")
+        if self.should_trip(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()  # the backend is up, the request was bad
+        raise error
+
+    def _may_hedge(self):
+        if self.breaker.state != "closed":
+            return False  # a half-open probe goes alone: the backend is known to be unhealthy
+        with self.lock:
+            if self.stats["hedges"] >= self.max_hedge_ratio * self.stats["calls"] + 1:
+                return False
+        return self.rate_limiter is None or self.rate_limiter.try_acquire()
+
+    def snapshot(self):
+        """Breaker state, p95 and hedge win-rate, for display or logging."""
+        with self.lock:
+            stats = dict(self.stats)
+        stats["state"] = self.breaker.state
+        stats["p95_ms"] = round(self.latency.p95() * 1000)
+        stats["hedge_win_rate"] = round(stats["hedge_wins"] / stats["hedges"], 2) if stats["hedges"] else 0.0
+        return stats
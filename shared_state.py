@@ -0,0 +1,503 @@
+"""
+Shared state for AURA: conversation history, the interaction log and counters,
+behind one interface so several app workers can share them.
+
+- InMemoryStore: Redis-style commands on Python dicts; one process only (default).
+- RedisStore:    the same commands over the Redis protocol (RESP) to any
+                 Redis-compatible server, with pipelining. No client library needed.
+- SharedState:   what the app uses - history / log / counters - on either store.
+                 `pipeline()` batches several operations into one round trip.
+- MiniRedisServer: a tiny Redis-protocol server over InMemoryStore, a local
+                 stand-in for a real Redis in tests and load runs.
+
+Pick a store with AURA_STATE_URL: "memory://" (default) or "redis://[:password@]host:port/db".
+"""
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from urllib.parse import urlparse
+from resilience import DeadlineExceeded, RateLimiter
+
+HISTORY_KEEP = 50 # Messages kept per conversation
+HISTORY_TTL_S = 24 * 3600 # Idle conversations expire after a day
+LOG_KEEP = 10000 # Interactions kept in the shared log
+
+
+class StateError(RuntimeError):
+    """A store command failed (bad command, wrong type, server error)."""
+
+
+# --- IN-PROCESS STORE ---
+class InMemoryStore:
+    """The subset of Redis commands SharedState needs, on dicts, under one lock.
+
+    Values come back as str/int/list/None, exactly like RedisStore, so the two
+    are interchangeable. Expired keys are dropped lazily and in periodic sweeps.
+    """
+    SWEEP_EVERY = 1000
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+        self.ops = 0
+
+    def execute(self, *cmd):
+        return self.execute_many([cmd])[0]
+
+    def execute_many(self, commands, timeout=None):
+        """Run commands atomically; errors are raised after the whole batch ran.
+        `timeout` is accepted for RedisStore compatibility (nothing here waits on I/O)."""
+        results, error = [], None
+        with self.lock:
+            for cmd in commands:
+                try:
+                    results.append(self._run(cmd))
+                except StateError as e:
+                    results.append(e)
+                    error = error or e
+            self.ops += len(commands)
+            if self.ops >= self.SWEEP_EVERY:
+                self.ops = 0
+                self._sweep()
+        if error:
+            raise error
+        return results
+
+    def _sweep(self):
+        now = time.monotonic()
+        for key in [k for k, at in self.expires.items() if at <= now]:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+
+    def _get(self, key, kind=None):
+        at = self.expires.get(key)
+        if at is not None and at <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        value = self.data.get(key)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise StateError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _run(self, cmd):
+        name, args = str(cmd[0]).upper(), [str(a) for a in cmd[1:]]
+        handler = getattr(self, f"_cmd_{name.lower()}", None)
+        if handler is None:
+            raise StateError(f"ERR unknown command '{name}'")
+        try:
+            return handler(*args)
+        except (TypeError, ValueError) as e:
+            raise StateError(f"ERR wrong arguments for '{name}': {e}")
+
+    def _cmd_ping(self):
+        return "PONG"
+
+    def _cmd_get(self, key):
+        return self._get(key, str)
+
+    def _cmd_set(self, key, value):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        return "OK"
+
+    def _cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._get(key) is not None:
+                removed += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def _cmd_incrby(self, key, amount):
+        value = int(self._get(key, str) or 0) + int(amount)
+        self.data[key] = str(value)
+        return value
+
+    def _cmd_expire(self, key, seconds):
+        if self._get(key) is None:
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        return 1
+
+    def _cmd_rpush(self, key, *values):
+        items = self._get(key, list)
+        if items is None:
+            items = self.data[key] = []
+        items.extend(values)
+        return len(items)
+
+    def _cmd_lrange(self, key, start, stop):
+        items = self._get(key, list) or []
+        start, stop = int(start), int(stop)
+        start = max(0, len(items) + start) if start < 0 else start
+        stop = len(items) + stop if stop < 0 else stop
+        if stop < 0:
+            return [] # stop before the first element, as in Redis
+        return items[start:stop + 1]
+
+    def _cmd_ltrim(self, key, start, stop):
+        items = self._get(key, list)
+        if items is not None:
+            items[:] = self._cmd_lrange(key, start, stop)
+            if not items:
+                self._cmd_del(key)
+        return "OK"
+
+    def _cmd_llen(self, key):
+        return len(self._get(key, list) or [])
+
+
+# --- NETWORKED STORE (REDIS PROTOCOL) ---
+def encode_command(*args):
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+def read_reply(f):
+    line = f.readline()
+    if not line:
+        raise ConnectionError("connection closed by state server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        return StateError(rest.decode("utf-8"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        data = f.read(size + 2)
+        return data[:-2].decode("utf-8")
+    if kind == b"*":
+        size = int(rest)
+        return None if size < 0 else [read_reply(f) for _ in range(size)]
+    raise StateError(f"protocol error: unexpected reply {line!r}")
+
+
+class RedisStore:
+    """Redis-protocol client with a small connection pool.
+
+    `execute_many` writes every command in one send and then reads all replies
+    (pipelining), so a batch costs one network round trip.
+    """
+
+    def __init__(self, url, pool_size=16, timeout=5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self, timeout):
+        sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        setup = ([("AUTH", self.password)] if self.password else []) + ([("SELECT", self.db)] if self.db else [])
+        if setup:
+            try:
+                self._roundtrip(conn, setup)
+            except Exception:
+                conn[1].close() # bad password / db: don't leak the half-set-up connection
+                sock.close()
+                raise
+        return conn
+
+    def _roundtrip(self, conn, commands):
+        sock, f = conn
+        sock.sendall(b"".join(encode_command(*cmd) for cmd in commands))
+        replies = [read_reply(f) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, StateError):
+                raise reply
+        return replies
+
+    def execute(self, *cmd):
+        return self.execute_many([cmd])[0]
+
+    def execute_many(self, commands, timeout=None):
+        """`timeout` (seconds) bounds connecting and the round trip; default self.timeout."""
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect(timeout)
+        try:
+            conn[0].settimeout(timeout)
+            replies = self._roundtrip(conn, commands)
+        except StateError:
+            self._release(conn) # server answered every command, connection is in sync
+            raise
+        except Exception:
+            conn[0].close()
+            raise
+        self._release(conn)
+        return replies
+
+    def _release(self, conn):
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn[0].close()
+
+
+# --- LOCAL STAND-IN SERVER ---
+class MiniRedisServer:
+    """Redis-protocol server backed by an InMemoryStore, for tests and load runs.
+
+        server = MiniRedisServer().start()
+        state = connect_state(server.url)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        store = self.store = InMemoryStore()
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                # Pipelined replies are several small writes; don't let Nagle hold them back
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def handle(self):
+                while True:
+                    try:
+                        cmd = read_reply(self.rfile)
+                    except (ConnectionError, OSError):
+                        return
+                    if not isinstance(cmd, list) or not cmd:
+                        self.wfile.write(b"-ERR expected a command array\r\n")
+                        continue
+                    try:
+                        self.wfile.write(self.encode(store.execute(*cmd)))
+                    except StateError as e:
+                        self.wfile.write(b"-%s\r\n" % str(e).encode("utf-8"))
+
+            def encode(self, value):
+                if value is None:
+                    return b"$-1\r\n"
+                if isinstance(value, int):
+                    return b":%d\r\n" % value
+                if isinstance(value, list):
+                    return b"*%d\r\n" % len(value) + b"".join(self.encode(v) for v in value)
+                data = str(value).encode("utf-8")
+                return b"$%d\r\n%s\r\n" % (len(data), data)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address[:2]
+
+    @property
+    def url(self):
+        return f"redis://{self.host}:{self.port}/0"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="mini-redis").start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# --- DOMAIN API ---
+class SharedState:
+    """Conversation history, interaction log and counters on a store.
+
+    Every method also exists on `pipeline()`, which queues the operations and runs
+    them in one round trip on `execute()` (or when its `with` block exits).
+    """
+
+    def __init__(self, store, prefix="aura"):
+        self.store = store
+        self.prefix = prefix
+
+    @property
+    def shared(self):
+        """True when the store is visible to other processes."""
+        return not isinstance(self.store, InMemoryStore)
+
+    def _key(self, *parts):
+        return ":".join((self.prefix,) + tuple(str(p) for p in parts))
+
+    # Each op returns (commands, decode) so pipelines can batch them
+    def _history_ops(self, session_id, limit=HISTORY_KEEP):
+        return [("LRANGE", self._key("history", session_id), -limit, -1)], \
+            lambda r: [json.loads(m) for m in r[0]]
+
+    def _append_history_ops(self, session_id, messages):
+        key = self._key("history", session_id)
+        return [("RPUSH", key, *[json.dumps(m) for m in messages]),
+                ("LTRIM", key, -HISTORY_KEEP, -1),
+                ("EXPIRE", key, HISTORY_TTL_S)], lambda r: r[0]
+
+    def _clear_history_ops(self, session_id):
+        return [("DEL", self._key("history", session_id))], lambda r: r[0]
+
+    def _log_interaction_ops(self, query, response, meta=""):
+        key = self._key("log")
+        entry = json.dumps({"ts": time.strftime("%Y-%m-%d %H:%M:%S"), "query": query,
+                            "response": response, "meta": meta})
+        return [("RPUSH", key, entry), ("LTRIM", key, -LOG_KEEP, -1)], lambda r: r[0]
+
+    def _recent_interactions_ops(self, limit=20):
+        return [("LRANGE", self._key("log"), -limit, -1)], lambda r: [json.loads(m) for m in r[0]]
+
+    def _incr_ops(self, name, amount=1, ttl=None):
+        key = self._key("counter", name)
+        cmds = [("INCRBY", key, amount)] + ([("EXPIRE", key, ttl)] if ttl else [])
+        return cmds, lambda r: r[0]
+
+    def _counter_ops(self, name):
+        return [("GET", self._key("counter", name))], lambda r: int(r[0] or 0)
+
+    def _run(self, ops, timeout=None):
+        commands, decode = ops
+        return decode(self.store.execute_many(commands, timeout=timeout))
+
+    def history(self, session_id, limit=HISTORY_KEEP):
+        return self._run(self._history_ops(session_id, limit))
+
+    def append_history(self, session_id, messages):
+        return self._run(self._append_history_ops(session_id, messages))
+
+    def clear_history(self, session_id):
+        return self._run(self._clear_history_ops(session_id))
+
+    def log_interaction(self, query, response, meta=""):
+        return self._run(self._log_interaction_ops(query, response, meta))
+
+    def recent_interactions(self, limit=20):
+        return self._run(self._recent_interactions_ops(limit))
+
+    def incr(self, name, amount=1, ttl=None, timeout=None):
+        return self._run(self._incr_ops(name, amount, ttl), timeout)
+
+    def counter(self, name, timeout=None):
+        return self._run(self._counter_ops(name), timeout)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+
+class Pipeline:
+    def __init__(self, state):
+        self.state = state
+        self.queued = []
+
+    def __getattr__(self, name):
+        build = getattr(self.state, f"_{name}_ops", None)
+        if build is None:
+            raise AttributeError(name)
+
+        def queue_op(*args, **kwargs):
+            self.queued.append(build(*args, **kwargs))
+            return self
+        return queue_op
+
+    def execute(self):
+        """Run everything queued in one round trip; returns one result per operation."""
+        queued, self.queued = self.queued, []
+        commands = [cmd for cmds, _ in queued for cmd in cmds]
+        if not commands:
+            return []
+        replies = self.state.store.execute_many(commands)
+        results, i = [], 0
+        for cmds, decode in queued:
+            results.append(decode(replies[i:i + len(cmds)]))
+            i += len(cmds)
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.execute()
+        return False
+
+
+# --- SHARED RATE LIMITER ---
+class SharedRateLimiter:
+    """Fixed-window limit of `per_minute` calls across every worker sharing `state`.
+    Same acquire/try_acquire interface as resilience.RateLimiter, so a Dependency
+    can use either. Windows are a minute long, or longer for rates under one call a
+    minute (0.5/min is one call per 2-minute window).
+
+    Store calls are bounded by `timeout` and by the caller's deadline. If the store
+    can't be reached the limiter fails open to a local token bucket holding this
+    worker's share of the quota - 1/`workers`, where `workers` defaults to
+    AURA_WORKERS (else 1) - and tries the store again after `retry_after` seconds.
+    `acquire` waits in sleeps of at most `max_sleep` seconds, re-checking each time.
+    """
+
+    def __init__(self, state, name, per_minute, workers=None, timeout=0.5, retry_after=5.0, max_sleep=1.0):
+        self.state = state
+        self.name = name
+        self.per_minute = per_minute
+        self.window_s = max(60.0, 60.0 / per_minute)
+        self.limit = per_minute * self.window_s / 60 # calls allowed per window
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.max_sleep = max_sleep
+        workers = max(1, int(workers or os.getenv("AURA_WORKERS") or 1))
+        self.local = RateLimiter(per_minute / workers / 60) # so N workers falling back together stay under quota
+        self.down_until = 0.0
+        self.full_window = None # window seen exhausted; retries GET it instead of INCR
+
+    def _take(self, timeout):
+        """True/False from the shared counter, or None when the store is unavailable."""
+        if time.monotonic() < self.down_until:
+            return None
+        window = int(time.time() // self.window_s)
+        key = f"rate:{self.name}:{window}"
+        timeout = max(0.01, timeout)
+        try:
+            if self.full_window == window and self.state.counter(key, timeout=timeout) >= self.limit:
+                return False
+            if self.state.incr(key, ttl=int(2 * self.window_s), timeout=timeout) <= self.limit:
+                return True
+            self.full_window = window
+            return False
+        except (OSError, StateError):
+            self.down_until = time.monotonic() + self.retry_after
+            return None
+
+    def try_acquire(self):
+        allowed = self._take(self.timeout)
+        return self.local.try_acquire() if allowed is None else allowed
+
+    def acquire(self, deadline):
+        while True:
+            allowed = self._take(min(self.timeout, deadline.remaining()))
+            if allowed is None:
+                return self.local.acquire(deadline)
+            if allowed:
+                return
+            window_left = self.window_s - time.time() % self.window_s
+            if window_left > deadline.remaining():
+                raise DeadlineExceeded("shared rate limit wait would overrun the deadline")
+            time.sleep(min(self.max_sleep, window_left))
+
+
+def connect_state(url=None):
+    """SharedState for `url`, else AURA_STATE_URL, else an in-process store."""
+    url = url or os.getenv("AURA_STATE_URL") or "memory://"
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return SharedState(InMemoryStore())
+    if scheme == "redis":
+        return SharedState(RedisStore(url))
+    raise ValueError(f"Unsupported AURA_STATE_URL scheme: {scheme}://")
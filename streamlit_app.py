@@ -1,19 +1,20 @@
 import streamlit as st
 import os
 import time
-import datetime
-import sqlite3
 import json
 import base64
+import re
+import uuid
 from pathlib import Path
-from groq import Groq
 from dotenv import load_dotenv
-from duckduckgo_search import DDGS
+import brain
+from resilience import Dependency
+from shared_state import SharedRateLimiter, connect_state
 
 # --- CONFIGURATION (BEST PERFORMANCE) ---
 ST_PAGE_TITLE = "AURA | Hyper-Intelligent Voice"
 ST_PAGE_ICON = "⚡"
-GROQ_MODEL = "llama-3.3-70b-versatile" # Smartest fast model
+SID_PATTERN = re.compile(r"[0-9a-f]{32}") # uuid4().hex; anything else in ?sid= is replaced
 
 # Load Environment
 load_dotenv()
@@ -23,46 +24,18 @@ st.set_page_config(page_title=ST_PAGE_TITLE, page_icon=ST_PAGE_ICON, layout="wid
 
 # Paths
 BASE_DIR = Path(__file__).parent
-DATA_DIR = BASE_DIR / "aura_data"
-DATA_DIR.mkdir(exist_ok=True, parents=True)
-DB_PATH = DATA_DIR / "aura_memory.db"
 LOGO_PATH = BASE_DIR / "assets" / "logo.png"
 
 # --- DATABASE & MEMORY (Robust) ---
-def init_db():
-    """Initialize SQLite database with error handling for read-only environments."""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS memory_vault
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                      timestamp TEXT, 
-                      user_query TEXT, 
-                      bot_response TEXT,
-                      meta_info TEXT)''')
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        # st.warning(f"⚠️ Memory Vault Error (Running in Stateless Mode): {e}")
-        return False
-
-def save_interaction(query, response, meta=""):
-    try:
-        if not DB_PATH.parent.exists(): return
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        c.execute("INSERT INTO memory_vault (timestamp, user_query, bot_response, meta_info) VALUES (?, ?, ?, ?)",
-                  (ts, query, response, meta))
-        conn.commit()
-        conn.close()
-    except: pass
-
-init_db()
+brain.init_db()
 
 # --- SESSION STATE ---
-if 'history' not in st.session_state: st.session_state.history = []
+# Conversation id lives in the URL, so whichever worker serves a reload finds the same history
+# (random ids only; history is stored under "app:<sid>", apart from batch.py's "batch:" keys)
+if 'sid' not in st.session_state:
+    url_sid = st.query_params.get("sid", "")
+    st.session_state.sid = url_sid if SID_PATTERN.fullmatch(url_sid) else uuid.uuid4().hex
+if st.query_params.get("sid") != st.session_state.sid: st.query_params["sid"] = st.session_state.sid
 if 'voice_active' not in st.session_state: st.session_state.voice_active = False # Main toggle
 if 'audio_queue' not in st.session_state: st.session_state.audio_queue = None
 if 'processing_state' not in st.session_state: st.session_state.processing_state = "idle" 
@@ -73,38 +46,23 @@ if not api_key:
     st.error("🚨 CRITICAL: GROQ_API_KEY not found in .env file.")
     st.stop()
 
-# --- TOOLS (WEB SEARCH) ---
-def search_web(query):
-    """Deep web search using DuckDuckGo."""
-    try:
-        with DDGS() as ddgs:
-            results = list(ddgs.text(query, max_results=3))
-            if results:
-                summary = "\n".join([f"- {r['title']}: {r['body']} ({r['href']})" for r in results])
-                return summary
-            return "No relevant search results found."
-    except Exception as e:
-        return f"Search error: {e}"
-
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "search_web",
-            "description": "Search the internet for real-time information, news, stocks, or facts.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "The search query keywords",
-                    }
-                },
-                "required": ["query"],
-            },
-        },
-    }
-]
+# --- BACKENDS (shared by every session in this process) ---
+@st.cache_resource
+def get_client():
+    return brain.make_client(api_key)
+
+@st.cache_resource
+def get_state():
+    # History, interaction log and counters; AURA_STATE_URL=redis://... shares them across workers
+    return connect_state()
+
+@st.cache_resource
+def get_resilience():
+    # AURA_GROQ_RPM caps Groq calls per minute across every worker sharing the state backend;
+    # AURA_WORKERS (the replica count) splits it locally if that backend becomes unreachable
+    rpm = float(os.getenv("AURA_GROQ_RPM") or 0)
+    limiter = SharedRateLimiter(get_state(), "groq", rpm) if rpm > 0 else None
+    return brain.make_resilience(groq_rate_limiter=limiter)
 
 # --- LUXURY UI DESIGN ---
 st.markdown("""
@@ -194,7 +152,9 @@ with col_title:
     st.markdown('<div class="hero-container"><div class="neon-text">AURA AI</div></div>', unsafe_allow_html=True)
 
 # --- VISUAL ORB ---
-def render_orb():
+def render_orb(slot=None):
+    """Draw the orb, into `slot` (an st.empty placeholder) when given so it updates in place."""
+    target = slot if slot is not None else st
     state = st.session_state.processing_state
     css_class = ""
     status_text = "SYSTEM READY"
@@ -212,7 +172,7 @@ def render_orb():
         css_class = "active"
         status_text = "LISTENING..."
             
-    st.markdown(f"""
+    target.markdown(f"""
         <div class="orb-stage {css_class}">
             <div class="ring r1"></div>
             <div class="ring r2"></div>
@@ -438,91 +398,44 @@ def titan_bridge():
     st.components.v1.html(js_code, height=180)
 
 # --- BRAIN (GROQ + TOOLS) ---
-def process_brain(user_input):
-    client = Groq(api_key=api_key)
-    
-    # 1. Build Context
-    sys_prompt = """
-    You are AURA, an advanced AI.
-    Traits: Intelligent, Fast, Helpful. 
-    
-    TOOL USE RULES:
-    - If the user asks for current info/news, YOU MUST USE THE search_web TOOL.
-    - AFTER calling the tool, you will receive the search results. 
-    - You MUST then read those results and Synthesize a clear, direct answer to the user's question.
-    - Do NOT just say "search results found". Answer the question using the data!
-    - Keep voice answers concise (under 2 sentences) but informative.
-    """
-    
-    messages = [{"role": "system", "content": sys_prompt}]
-    
-    # Add recent history
-    recent_history = st.session_state.history[-4:]
-    for turn in recent_history:
-        messages.append({"role": turn["role"], "content": turn["content"]})
-    
-    messages.append({"role": "user", "content": user_input})
-    
-    # 2. Inference
+def process_brain(user_input, history):
+    answer, _, _ = brain.process_brain(user_input, history, get_client(), get_resilience(), notify=st.toast)
+    return answer
+
+# --- SHARED MEMORY ---
+def history_key():
+    return f"app:{st.session_state.sid}"
+
+def load_history():
     try:
-        completion = client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=messages,
-            tools=tools,
-            tool_choice="auto",
-            max_tokens=256
-        )
-        
-        msg = completion.choices[0].message
-        
-        # 3. Tool Calling Handling
-        if msg.tool_calls:
-            st.session_state.processing_state = "thinking"
-            render_orb() 
-            
-            tool_call = msg.tool_calls[0]
-            if tool_call.function.name == "search_web":
-                args = json.loads(tool_call.function.arguments)
-                st.toast(f"🔎 Searching Web: {args['query']}")
-                search_res = search_web(args['query'])
-                
-                # Feed tool output back
-                messages.append(msg)
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": str(search_res)
-                })
-                
-                # Final response (Second Turn)
-                # We need to tell the model to use the tool info to answer
-                final_res = client.chat.completions.create(
-                    model=GROQ_MODEL,
-                    messages=messages,
-                    max_tokens=256
-                )
-                return final_res.choices[0].message.content
-                
-        return msg.content
+        return get_state().history(history_key())
+    except Exception as e:
+        st.toast(f"⚠️ Shared memory unreachable ({type(e).__name__}) - starting fresh")
+        return []
 
+def save_turn(user_input, response):
+    """History, shared log and turn counter in one round trip, plus the local vault."""
+    try:
+        with get_state().pipeline() as p:
+            p.append_history(history_key(), [{"role": "user", "content": user_input},
+                                             {"role": "assistant", "content": response}])
+            p.log_interaction(user_input, response)
+            p.incr("turns")
     except Exception as e:
-        # Fallback
-        if "tool_use_failed" in str(e) or "400" in str(e):
-             st.error("Tool Error - Retrying basic response")
-             try:
-                 messages.append({"role": "user", "content": "Please answer without tools if possible."})
-                 completion = client.chat.completions.create(
-                    model=GROQ_MODEL,
-                    messages=messages,
-                    max_tokens=256
-                )
-                 return completion.choices[0].message.content
-             except:
-                 pass
-        return f"I encountered a neural error: {str(e)}"
+        st.toast(f"⚠️ Shared memory unreachable ({type(e).__name__}) - turn not saved")
+    brain.save_interaction(user_input, response)
 
 # --- MAIN CONTROLLER ---
 
+def clear_history():
+    try:
+        get_state().clear_history(history_key())
+    except Exception as e:
+        st.toast(f"⚠️ Shared memory unreachable ({type(e).__name__})")
+
+def set_voice_active(active):
+    st.session_state.voice_active = active
+
 # 1. SETTINGS (Moved to Main Page for Mobile Access)
 with st.expander("⚙️ Settings & Customization", expanded=False):
     c1, c2 = st.columns(2)
@@ -532,18 +445,26 @@ with st.expander("⚙️ Settings & Customization", expanded=False):
         st.session_state.v_gender = st.radio("Voice Identity", ["Female", "Male"], horizontal=True)
     with c2:
         st.write("") # Spacer
-        if st.button("🗑️ Clear Memory Cache"):
-            st.session_state.history = []
-            st.rerun()
-
-# 2. Render Orb
-render_orb()
+        # Callback runs before the script, so the cleared history renders in this same run
+        st.button("🗑️ Clear Memory Cache", on_click=clear_history)
+    # Backend health: breaker state, observed p95 and hedge win-rate
+    health = {name: dep.snapshot() for name, dep in get_resilience().items() if isinstance(dep, Dependency)}
+    st.caption("  |  ".join(
+        f"{name.upper()}: {h['state']} · p95 {h['p95_ms']}ms · hedges won {h['hedge_wins']}/{h['hedges']} "
+        f"({h['hedge_win_rate']:.0%}) · fast-fails {h['rejected']}"
+        for name, h in health.items()
+    ))
+    try:
+        turns = get_state().counter("turns")
+        st.caption(f"STATE: {'shared' if get_state().shared else 'this worker only'} · turns served {turns}")
+    except Exception as e:
+        st.caption(f"STATE: unreachable ({type(e).__name__})")
 
 # --- THE TITAN BRIDGE (HANDS-FREE LOOP) ---
+# Static mic/speech iframe, drawn outside the conversation fragment so it isn't
+# re-sent (or reloaded) on every turn. Each turn's reply reaches it through
+# speech_signal() below.
 def titan_bridge():
-    # Retrieve payload
-    payload = st.session_state.audio_queue if st.session_state.audio_queue else ""
-    is_active = st.session_state.voice_active
     gender_pref = st.session_state.v_gender.lower()
     
     js_code = f"""
@@ -563,8 +484,6 @@ def titan_bridge():
         </div>
 
         <script>
-            var speakText = {json.dumps(payload)};
-            var isActive = {json.dumps(is_active)};
             var genderPref = "{gender_pref}";
             
             var recognition = null;
@@ -675,87 +594,59 @@ def titan_bridge():
             }}
             
             // --- AUTO-RUN LOGIC (The Fix) ---
-            if (isActive) {{
-                // If Python says we are active (meaning user clicked it previously)
-                // We try to resume immediately.
-                if (speakText) {{
-                    setTimeout(() => speak(speakText), 500); 
-                }} else {{
+            // Called by speech_signal() after every turn with the reply to speak and the loop state
+            window.auraBridge = function(msg) {{
+                if (!msg.active) {{
+                    // Python says we are stopped: silence whatever is running
+                    if (synth.speaking || isListening) {{
+                        synth.cancel();
+                        isListening = false;
+                        if (recognition) recognition.stop();
+                        updateUI("💤 Paused", false);
+                    }}
+                    return;
+                }}
+                if (msg.speak) {{
+                    setTimeout(() => speak(msg.speak), 500);
+                }} else if (!isListening && !synth.speaking) {{
                     setTimeout(() => {{
                         if (!recognition) recognition = initRecognition();
                         isListening = true;
                         try {{ recognition.start(); }} catch(e) {{}}
                     }}, 500);
                 }}
-            }}
+            }};
 
         </script>
     """
     st.components.v1.html(js_code, height=180)
 
-# 3. Render Manual Bridge (The Microphone Button)
-if 'voice_active' not in st.session_state: st.session_state.voice_active = False
-
-# We need a way to Toggle Active State in Python so it persists
-# The previous button handled this inside the Js effectively, but we need Python to know.
-# Actually, the 'Hands Free' relies on Python re-rendering with is_active=True.
-# We'll use a hidden button or just rely on the fact that if 'audio_queue' is present, we imply active?
-# No, we need an explicit toggle.
-
-# Let's add a REAL Python toggle to control "System Power"
-# We'll put it above the bridge or use the sidebar
-col_c1, col_c2 = st.columns([1,1])
-with col_c1:
-    # If user clicks this, we set voice_active = True
-    # The JS will then see isActive=True and auto-start.
-    if st.button("🔴 RESET / STOP"):
-        st.session_state.voice_active = False
-        st.rerun()
-
-with col_c2:
-    if not st.session_state.voice_active:
-        if st.button("🟢 AUTO-START"):
-            st.session_state.voice_active = True
-            st.rerun()
-    else:
-        st.success("System Active")
-
-titan_bridge()
-
-# 4. Hidden Input & Logic Loop
-user_input = st.chat_input("Type or Speak...", key="main_input") # Receiver for JS
+def speech_signal():
+    """Hand this turn's reply and the loop state to the bridge iframe (a few hundred bytes)."""
+    msg = json.dumps({
+        "speak": st.session_state.audio_queue or "",
+        "active": st.session_state.voice_active,
+        "turn": uuid.uuid4().hex, # always new, so the iframe remounts and delivers
+    }).replace("</", "<\\/")
+    st.components.v1.html(f"""
+        <script>
+            (function deliver(tries) {{
+                for (const frame of window.parent.document.querySelectorAll('iframe')) {{
+                    try {{
+                        if (frame.contentWindow.auraBridge) {{ frame.contentWindow.auraBridge({msg}); return; }}
+                    }} catch(e) {{}}
+                }}
+                if (tries > 0) setTimeout(() => deliver(tries - 1), 100); // bridge still loading
+            }})(50);
+        </script>
+    """, height=0)
 
-if user_input:
-    # Set state
-    st.session_state.processing_state = "thinking"
-    st.session_state.history.append({"role": "user", "content": user_input})
-    
-    # Process
-    with st.spinner("Processing..."):
-        response = process_brain(user_input)
-    
-    # Save
-    st.session_state.history.append({"role": "assistant", "content": response})
-    st.session_state.audio_queue = response # Set for TTS
-    st.session_state.processing_state = "speaking"
-    
-    save_interaction(user_input, response)
-    st.rerun()
-
-# 5. Clear queue after render if it was consumed? 
-# Actually we need it to persist for the JS to read it on this run.
-# The JS reads `speakText` from python on load.
-# We clear it on the *next* run or never? 
-# Streamlit re-runs script top-to-bottom. 
-# If we clear it here, next re-run will be empty. That is correct.
-# BUT wait, the `titan_bridge` function runs above. It has ALREADY read the queue into the JS string.
-# So we can safely clear it here so it doesn't speak again on next refresh.
-st.session_state.audio_queue = None
-
-# 6. Display History
-if st.session_state.history:
+# --- CHAT BUBBLES ---
+def render_history(history):
+    if not history:
+        return
     st.markdown("<br>", unsafe_allow_html=True)
-    for msg in reversed(st.session_state.history[-6:]):
+    for msg in reversed(history[-6:]):
         role_cls = "user" if msg["role"] == "user" else "aura"
         st.markdown(f"""
             <div class="chat-row {role_cls}">
@@ -765,3 +656,59 @@ if st.session_state.history:
                 </div>
             </div>
         """, unsafe_allow_html=True)
+
+# --- CONVERSATION STAGE (FRAGMENT) ---
+# Everything that changes on a turn lives in this fragment: orb, power toggle,
+# the speech signal and the latest bubbles. A chat input or toggle click only
+# reruns this function, so the CSS, header and settings expander are not
+# rebuilt and no second full-page st.rerun() is needed.
+@st.fragment
+def conversation_stage():
+    # 2. Orb placeholder (redrawn in place while thinking)
+    orb_slot = st.empty()
+
+    # 3. Power toggle
+    # The JS sees isActive=True and auto-starts the hands-free loop.
+    col_c1, col_c2 = st.columns([1,1])
+    with col_c1:
+        st.button("🔴 RESET / STOP", on_click=set_voice_active, args=(False,))
+    with col_c2:
+        if not st.session_state.voice_active:
+            st.button("🟢 AUTO-START", on_click=set_voice_active, args=(True,))
+        else:
+            st.success("System Active")
+
+    # 4. Hidden Input & Logic Loop
+    user_input = st.chat_input("Type or Speak...", key="main_input") # Receiver for JS
+    history = load_history()
+
+    if user_input:
+        # Set state
+        st.session_state.processing_state = "thinking"
+        history.append({"role": "user", "content": user_input})
+        render_orb(orb_slot)
+
+        # Process
+        with st.spinner("Processing..."):
+            response = process_brain(user_input, history)
+
+        # Save
+        history.append({"role": "assistant", "content": response})
+        st.session_state.audio_queue = response # Set for TTS
+        st.session_state.processing_state = "speaking"
+
+        save_turn(user_input, response)
+
+    # Final state of this turn, rendered once
+    render_orb(orb_slot)
+    speech_signal()
+
+    # 5. The signal has already read the queue into its JS string,
+    # so clear it here so it doesn't speak again on the next run.
+    st.session_state.audio_queue = None
+
+    # 6. Display History
+    render_history(history)
+
+titan_bridge()
+conversation_stage()
@@ -0,0 +1,112 @@
+import json
+from types import SimpleNamespace
+import pytest
+import batch
+import brain
+from shared_state import MiniRedisServer
+
+
+class RecordingClient:
+    """Groq stand-in that answers "answer to <query>" and keeps every message list it was sent."""
+
+    def __init__(self):
+        self.sent = []
+        self.down = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages=None, **kwargs):
+        self.sent.append(messages)
+        if self.down:
+            raise ConnectionError("groq is down")
+        message = SimpleNamespace(content=f"answer to {messages[-1]['content']}", tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    fake = RecordingClient()
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    monkeypatch.delenv("AURA_STATE_URL", raising=False)
+    monkeypatch.setattr(brain, "DB_PATH", tmp_path / "vault.db")
+    monkeypatch.setattr(brain, "make_client", lambda api_key: fake)
+    return fake
+
+
+def write_jsonl(path, rows):
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_resume_replays_session_history(client, tmp_path):
+    src, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_jsonl(src, [{"id": i, "session": "s", "query": f"q{i}"} for i in (1, 2, 3)])
+    write_jsonl(out, [{"id": 1, "session": "s", "query": "q1", "answer": "a1", "error": None},
+                      {"id": 2, "session": "s", "query": "q2", "answer": "a2", "error": None}])
+
+    assert batch.main([str(src), "-o", str(out), "--resume", "--no-vault"]) == 0
+    assert len(client.sent) == 1
+    context = [(m["role"], m["content"]) for m in client.sent[0][1:]]
+    assert context[:4] == [("user", "q1"), ("assistant", "a1"), ("user", "q2"), ("assistant", "a2")]
+    assert read_jsonl(out)[-1]["answer"] == "answer to q3"
+
+
+def test_checkpoint_keeps_answers_only_for_replayed_session_rows(tmp_path):
+    out = tmp_path / "out.jsonl"
+    write_jsonl(out, [{"id": 1, "session": None, "answer": "a1", "error": None},
+                      {"id": 2, "session": "s", "answer": "a2", "error": None},
+                      {"id": 3, "session": "s", "answer": None, "error": "degraded: backend unavailable"}])
+    assert batch.load_checkpoint(out) == ({"1", "2"}, {})
+    assert batch.load_checkpoint(out, keep_answers=True) == ({"1", "2"}, {"2": "a2"})
+
+
+def test_input_errors_are_written_once_across_resumes(client, tmp_path):
+    src, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    src.write_text('{"id": "a", "query": "hello"}\nnot json\n{"id": "b"}\n123\n[1, 2]\nnull\n', encoding="utf-8")
+
+    assert batch.main([str(src), "-o", str(out), "--no-vault"]) == 1
+    assert batch.main([str(src), "-o", str(out), "--resume", "--no-vault"]) == 0
+    rows = read_jsonl(out)
+    assert len(rows) == 6
+    assert sorted(str(r["id"]) for r in rows if r.get("input_error")) == ["2", "4", "5", "6", "b"]
+    assert {r["error"] for r in rows if str(r["id"]) in ("4", "5", "6")} == {"expected a JSON object or string"}
+
+
+def test_stale_cached_answer_is_retried_on_resume(client, tmp_path):
+    src, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_jsonl(src, [{"id": 1, "query": "q"}, {"id": 2, "query": "q"}])
+    answer = client.create
+
+    def down_after_first(**kwargs):
+        client.down = bool(client.sent)  # row 1 warms the stale cache, row 2 finds Groq down
+        return answer(**kwargs)
+
+    client.chat.completions.create = down_after_first
+    assert batch.main([str(src), "-o", str(out), "--concurrency", "1", "--no-vault"]) == 1
+    rows = {r["id"]: r for r in read_jsonl(out)}
+    assert rows[1]["error"] is None
+    assert rows[2]["answer"] == "answer to q"
+    assert rows[2]["error"] == "degraded: backend unavailable"
+    assert batch.load_checkpoint(out)[0] == {"1"}
+
+
+@pytest.mark.parametrize("flag, value", [("--concurrency", "0"), ("--concurrency", "-2"),
+                                         ("--rpm", "0"), ("--deadline", "-1"), ("--rpm", "fast")])
+def test_non_positive_arguments_are_rejected(client, tmp_path, flag, value):
+    with pytest.raises(SystemExit) as exc:
+        batch.main([str(tmp_path / "in.jsonl"), "-o", str(tmp_path / "out.jsonl"), flag, value])
+    assert exc.value.code == 2
+
+
+def test_fractional_rpm_with_shared_state(client, tmp_path):
+    server = MiniRedisServer().start()
+    try:
+        src, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+        write_jsonl(src, [{"id": 1, "query": "q"}])
+        assert batch.main([str(src), "-o", str(out), "--rpm", "0.5", "--state-url", server.url,
+                           "--deadline", "5", "--no-vault"]) == 0
+        assert read_jsonl(out)[0]["answer"] == "answer to q"
+    finally:
+        server.stop()
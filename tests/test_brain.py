@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+import brain
+
+
+class FakeClient:
+    """Groq stand-in: answers with `reply`, or raises once `down` is set."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.down = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        if self.down:
+            raise ConnectionError("groq is down")
+        message = SimpleNamespace(content=self.reply, tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_stale_answer_is_not_served_to_another_conversation():
+    res = brain.make_resilience(max_workers=2)
+    client = FakeClient("You said your password is hunter2.")
+    history_a = [{"role": "user", "content": "my password is hunter2"},
+                 {"role": "assistant", "content": "Noted."}]
+    answer, _, degraded = brain.process_brain("what did I just say?", history_a, client, res, deadline_s=2)
+    assert answer == client.reply and not degraded
+
+    client.down = True
+    answer, _, degraded = brain.process_brain("what did I just say?", [], client, res, deadline_s=2)
+    assert answer == brain.FALLBACK_REPLY and degraded
+    answer, _, degraded = brain.process_brain("what did I just say?", history_a, client, res, deadline_s=2)
+    assert answer == client.reply and degraded
@@ -0,0 +1,182 @@
+import time
+import pytest
+from resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, Dependency
+
+
+def tripped(reset_timeout=0.05):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+# --- CIRCUIT BREAKER ---
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = tripped()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes():
+    breaker = tripped()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = tripped()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_release_returns_unused_probe():
+    breaker = tripped()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+def test_expired_deadline_does_not_strand_half_open_probe():
+    dep = Dependency("test", breaker=tripped(), max_workers=2)
+    time.sleep(0.06)
+    with pytest.raises(DeadlineExceeded):
+        dep.call(lambda: "late", Deadline(0))
+    assert dep.breaker.state == "half_open"
+    assert dep.call(lambda: "ok", Deadline(1)) == "ok"
+    assert dep.breaker.state == "closed"
+
+
+def test_open_breaker_rejects_without_calling():
+    calls = []
+    dep = Dependency("test", breaker=tripped(reset_timeout=60), max_workers=2)
+    with pytest.raises(CircuitOpenError):
+        dep.call(lambda: calls.append(1), Deadline(1))
+    assert calls == []
+    assert dep.snapshot()["rejected"] == 1
+
+
+def test_half_open_probe_is_not_hedged():
+    dep = Dependency("test", breaker=tripped(), max_workers=4)
+    dep.latency.default_p95 = 0.01
+    time.sleep(0.06)
+    assert dep.call(lambda: time.sleep(0.1) or "slow", Deadline(1)) == "slow"
+    assert dep.snapshot()["hedges"] == 0
+    assert dep.breaker.state == "closed"
+
+
+class CountingLimiter:
+    def __init__(self, allow=True):
+        self.allow = allow
+        self.acquired = 0
+
+    def acquire(self, deadline):
+        self.acquired += 1
+        if not self.allow:
+            raise DeadlineExceeded("no token")
+
+    def try_acquire(self):
+        self.acquired += 1
+        return self.allow
+
+
+def test_open_breaker_spends_no_rate_limit_token():
+    limiter = CountingLimiter()
+    dep = Dependency("test", breaker=tripped(reset_timeout=60), max_workers=2, rate_limiter=limiter)
+    with pytest.raises(CircuitOpenError):
+        dep.call(lambda: "ok", Deadline(1))
+    assert limiter.acquired == 0
+
+
+def test_rate_limit_timeout_releases_half_open_probe():
+    limiter = CountingLimiter(allow=False)
+    dep = Dependency("test", breaker=tripped(), max_workers=2, rate_limiter=limiter)
+    time.sleep(0.06)
+    with pytest.raises(DeadlineExceeded):
+        dep.call(lambda: "ok", Deadline(1))
+    limiter.allow = True
+    assert dep.call(lambda: "ok", Deadline(1)) == "ok"
+    assert dep.breaker.state == "closed"
+
+
+# --- DEPENDENCY ---
+def test_hedge_wins_when_first_attempt_stalls():
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            time.sleep(0.5)
+            return "primary"
+        return "hedge"
+
+    dep = Dependency("test", max_workers=4, max_hedge_ratio=1.0)
+    dep.latency.default_p95 = 0.02
+    assert dep.call(fn, Deadline(2)) == "hedge"
+    stats = dep.snapshot()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_hedges_are_capped_by_ratio():
+    dep = Dependency("test", max_workers=4, max_hedge_ratio=0.0)
+    dep.latency.default_p95 = 0.01
+    for _ in range(3):
+        dep.call(lambda: time.sleep(0.03) or "ok", Deadline(1))
+    assert dep.snapshot()["hedges"] == 1
+
+
+def test_slow_call_raises_deadline_and_counts_failure():
+    dep = Dependency("test", breaker=CircuitBreaker(failure_threshold=1), max_workers=4, max_hedge_ratio=0.0)
+    with pytest.raises(DeadlineExceeded):
+        dep.call(lambda: time.sleep(0.3), Deadline(0.05))
+    assert dep.snapshot()["timeouts"] == 1
+    assert dep.breaker.state == "open"
+
+
+def test_should_trip_false_keeps_breaker_closed():
+    def bad_request():
+        raise ValueError("400")
+
+    dep = Dependency("test", breaker=CircuitBreaker(failure_threshold=1), max_workers=2,
+                     should_trip=lambda e: not isinstance(e, ValueError))
+    with pytest.raises(ValueError):
+        dep.call(bad_request, Deadline(1))
+    assert dep.breaker.state == "closed"
+    assert dep.snapshot()["failures"] == 1
+
+
+def test_tripping_errors_open_the_breaker():
+    def down():
+        raise ConnectionError("503")
+
+    dep = Dependency("test", breaker=CircuitBreaker(failure_threshold=2), max_workers=2)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            dep.call(down, Deadline(1))
+    with pytest.raises(CircuitOpenError):
+        dep.call(down, Deadline(1))
@@ -0,0 +1,189 @@
+import socket
+import time
+import pytest
+from resilience import Deadline, DeadlineExceeded
+from shared_state import (HISTORY_KEEP, InMemoryStore, MiniRedisServer, RedisStore, SharedRateLimiter,
+                          StateError, connect_state)
+
+
+def unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- SHARED RATE LIMITER ---
+def test_limiter_counts_across_instances():
+    state = connect_state("memory://")
+    a = SharedRateLimiter(state, "groq", 3)
+    b = SharedRateLimiter(state, "groq", 3)
+    assert [a.try_acquire(), b.try_acquire(), a.try_acquire(), b.try_acquire()] == [True, True, True, False]
+
+
+def test_limiter_fails_open_when_store_is_down():
+    state = connect_state(f"redis://127.0.0.1:{unused_port()}/0")
+    limiter = SharedRateLimiter(state, "groq", 120)
+    t0 = time.monotonic()
+    limiter.acquire(Deadline(1))
+    assert limiter.try_acquire()
+    assert time.monotonic() - t0 < 1
+
+
+def test_limiter_store_call_is_bounded_by_deadline():
+    silent = socket.socket()
+    silent.bind(("127.0.0.1", 0))
+    silent.listen()  # accepts connections, never answers
+    try:
+        state = connect_state(f"redis://127.0.0.1:{silent.getsockname()[1]}/0")
+        limiter = SharedRateLimiter(state, "groq", 120, timeout=5.0)
+        t0 = time.monotonic()
+        limiter.acquire(Deadline(0.2))
+        assert time.monotonic() - t0 < 1
+    finally:
+        silent.close()
+
+
+def test_limiter_raises_when_window_outlives_deadline():
+    if 60 - time.time() % 60 < 1:
+        time.sleep(1)  # don't straddle a window boundary
+    limiter = SharedRateLimiter(connect_state("memory://"), "groq", 1)
+    assert limiter.try_acquire()
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(Deadline(0.1))
+
+
+def test_limiter_retries_in_a_full_window_do_not_incr():
+    if 60 - time.time() % 60 < 1:
+        time.sleep(1)
+    state = connect_state("memory://")
+    limiter = SharedRateLimiter(state, "groq", 2)
+    results = [limiter.try_acquire() for _ in range(6)]
+    assert results == [True, True, False, False, False, False]
+    window = int(time.time() // 60)
+    assert state.counter(f"rate:groq:{window}") == 3
+
+
+def test_limiter_wait_is_rechecked_in_short_sleeps(monkeypatch):
+    limiter = SharedRateLimiter(connect_state("memory://"), "groq", 1, max_sleep=0.05)
+    answers = iter([False, False, True])
+    monkeypatch.setattr(limiter, "_take", lambda timeout: next(answers))
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    limiter.acquire(Deadline(120))
+    assert len(sleeps) == 2 and max(sleeps) <= 0.05
+
+
+# --- IN-PROCESS STORE ---
+def test_lrange_matches_redis_indexing():
+    store = InMemoryStore()
+    store.execute("RPUSH", "l", "a", "b", "c", "d")
+    assert store.execute("LRANGE", "l", 0, -1) == ["a", "b", "c", "d"]
+    assert store.execute("LRANGE", "l", -2, -1) == ["c", "d"]
+    assert store.execute("LRANGE", "l", -10, 1) == ["a", "b"]
+    assert store.execute("LRANGE", "l", 1, 100) == ["b", "c", "d"]
+    assert store.execute("LRANGE", "l", 3, 1) == []
+    assert store.execute("LRANGE", "l", 0, -7) == []
+    assert store.execute("LRANGE", "l", -7, -5) == []
+    assert store.execute("LRANGE", "missing", 0, -1) == []
+
+
+def test_ltrim_keeps_tail_and_deletes_empty_list():
+    store = InMemoryStore()
+    store.execute("RPUSH", "l", "a", "b", "c", "d")
+    store.execute("LTRIM", "l", -2, -1)
+    assert store.execute("LRANGE", "l", 0, -1) == ["c", "d"]
+    store.execute("LTRIM", "l", 0, -3)
+    assert store.execute("LLEN", "l") == 0
+    store.execute("RPUSH", "l", "a", "b")
+    store.execute("LTRIM", "l", 5, 10)
+    assert store.execute("LLEN", "l") == 0
+    assert "l" not in store.data
+
+
+def test_wrong_type_and_unknown_command_raise():
+    store = InMemoryStore()
+    store.execute("SET", "k", "v")
+    with pytest.raises(StateError):
+        store.execute("RPUSH", "k", "x")
+    with pytest.raises(StateError):
+        store.execute("NOPE")
+
+
+def test_expire_drops_key():
+    store = InMemoryStore()
+    store.execute("SET", "k", "v")
+    assert store.execute("EXPIRE", "k", 0) == 1
+    assert store.execute("GET", "k") is None
+
+
+# --- REDIS STORE AGAINST THE STAND-IN SERVER ---
+@pytest.fixture
+def server():
+    server = MiniRedisServer().start()
+    yield server
+    server.stop()
+
+
+def test_redis_store_round_trips_types(server):
+    store = RedisStore(server.url)
+    assert store.execute("PING") == "PONG"
+    assert store.execute("GET", "missing") is None
+    assert store.execute("INCRBY", "n", 5) == 5
+    assert store.execute("RPUSH", "l", "é", "b") == 2
+    assert store.execute("LRANGE", "l", 0, -1) == ["é", "b"]
+    with pytest.raises(StateError):
+        store.execute("NOPE")
+    assert store.execute("PING") == "PONG"  # the connection stays usable after an error reply
+
+
+def test_shared_state_over_redis_pipeline(server):
+    state = connect_state(server.url)
+    assert state.shared
+    with state.pipeline() as p:
+        p.append_history("app:x", [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}])
+        p.log_interaction("hi", "hello")
+        p.incr("turns")
+    assert state.history("app:x") == [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    assert state.recent_interactions()[-1]["response"] == "hello"
+    assert state.counter("turns") == 1
+    state.clear_history("app:x")
+    assert state.history("app:x") == []
+
+
+def test_history_is_capped(server):
+    state = connect_state(server.url)
+    for i in range(HISTORY_KEEP + 5):
+        state.append_history("s", [{"role": "user", "content": str(i)}])
+    history = state.history("s")
+    assert len(history) == HISTORY_KEEP
+    assert history[-1]["content"] == str(HISTORY_KEEP + 4)
+
+
+def test_limiter_fallback_is_a_per_worker_share(monkeypatch):
+    state = connect_state(f"redis://127.0.0.1:{unused_port()}/0")
+    assert SharedRateLimiter(state, "groq", 600, workers=4).local.rate == pytest.approx(600 / 4 / 60)
+    monkeypatch.setenv("AURA_WORKERS", "3")
+    assert SharedRateLimiter(state, "groq", 600).local.rate == pytest.approx(600 / 3 / 60)
+
+
+def test_failed_auth_closes_the_connection(server, monkeypatch):
+    opened = []
+    real_connect = socket.create_connection
+
+    def tracking_connect(*args, **kwargs):
+        opened.append(real_connect(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(socket, "create_connection", tracking_connect)
+    store = RedisStore(f"redis://:wrong@{server.host}:{server.port}/0")
+    with pytest.raises(StateError):
+        store.execute("PING")
+    assert len(opened) == 1 and opened[0].fileno() == -1
+
+
+def test_limiter_supports_rates_under_one_per_minute():
+    if 120 - time.time() % 120 < 1:
+        time.sleep(1)
+    limiter = SharedRateLimiter(connect_state("memory://"), "groq", 0.5)
+    assert limiter.window_s == 120
+    assert [limiter.try_acquire(), limiter.try_acquire()] == [True, False]